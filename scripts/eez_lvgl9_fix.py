@@ -12,8 +12,125 @@ Updated: 20250212 - Fixed to ADD animation parameters for LVGL 9.3.0
 
 # type: ignore - PlatformIO build script
 Import("env")  # type: ignore # Provided by PlatformIO SCons environment
+import hashlib
+import json
+import mmap
 import os
 import re
+from collections import Counter
+
+# Functions whose animation parameter (third parameter) is added
+_FIXED_FUNCTIONS = (
+    'lv_bar_set_value',
+    'lv_roller_set_selected',
+    'lv_slider_set_value',
+    'lv_slider_set_start_value',
+    'lv_dropdown_set_selected'
+)
+_FIXED_FUNCTION_NAMES = tuple(name.encode('ascii') for name in _FIXED_FUNCTIONS)
+
+# Two-argument call to any of the fixed functions; the 'fn' group names the
+# function for the per-function counts. Matched against raw bytes:
+#   Matches:       lv_bar_set_value(obj, value)
+#   Replaces with: lv_bar_set_value(obj, value, LV_ANIM_OFF)
+# The engine only attempts a match where the first-character check hits 'l',
+# which already beats a separate literal pre-scan plus per-candidate confirm.
+# A leading \b would disable that check, so it is deliberately left out.
+# EEZ never emits whitespace between the function name and '(', so none is
+# allowed there. The second argument may not contain a ',' (parentheses one
+# level deep, as in a (uint16_t) cast, are allowed), so only two-argument
+# calls match and calls that already pass an animation flag are left alone.
+_ADD_PATTERN = re.compile(
+    rb'(?P<fn>' + '|'.join(_FIXED_FUNCTIONS).encode('ascii') + rb')\(\s*([^,]+?),\s*((?:[^,()]|\([^()]*\))+?)\)',
+    re.ASCII
+)
+
+def _add_anim_param(match):
+    return match.group('fn') + b'(' + match.group(2) + b', ' + match.group(3) + b', LV_ANIM_OFF)'
+
+def _load_fix_cache(cache_path):
+    """Load the already-fixed sentinel, or None if missing or unreadable"""
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_json_atomic(path, obj):
+    """Write obj as JSON via a temporary file, so readers never see half of it"""
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(obj, f)
+    os.replace(temp_path, path)
+
+def _save_fix_cache(cache_path, eez_flow_path):
+    """Record the fixed file's mtime and size as the already-fixed state"""
+    st = os.stat(eez_flow_path)
+    cache = {
+        'mtime_ns': st.st_mtime_ns,
+        'size': st.st_size
+    }
+    try:
+        _write_json_atomic(cache_path, cache)
+    except OSError as e:
+        print(f"⚠️  Could not write EEZ fix cache {cache_path}: {e}")
+
+def _load_patch_memo(memo_path, digest, data_len):
+    """
+    Load the recorded edit list if it was made for this exact content
+    
+    Returns None if the memo is missing, for other content, or malformed;
+    every edit is checked to lie in order inside the data before replay.
+    """
+    try:
+        with open(memo_path, 'r', encoding='utf-8') as f:
+            memo = json.load(f)
+        
+        if memo['digest'] != digest:
+            return None
+        
+        edits = []
+        last = 0
+        for offset, old_len, new_hex, name in memo['edits']:
+            if not (isinstance(offset, int) and isinstance(old_len, int)
+                    and last <= offset and old_len >= 0
+                    and offset + old_len <= data_len and name in _FIXED_FUNCTIONS):
+                return None
+            edits.append((offset, old_len, bytes.fromhex(new_hex), name))
+            last = offset + old_len
+        
+        return edits
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+def _save_patch_memo(memo_path, digest, edits):
+    """Record the edit list for replay; only the latest content is kept"""
+    memo = {
+        'digest': digest,
+        'edits': [[offset, old_len, new_bytes.hex(), name] for offset, old_len, new_bytes, name in edits]
+    }
+    try:
+        os.makedirs(os.path.dirname(memo_path), exist_ok=True)
+        _write_json_atomic(memo_path, memo)
+    except OSError as e:
+        print(f"⚠️  Could not write EEZ patch memo {memo_path}: {e}")
+
+def _find_edits(data):
+    """Scan once and return (offset, old_len, new_bytes, function) edits"""
+    edits = []
+    
+    # Plain substring checks are far cheaper than the regex, so only scan
+    # when at least one of the function names appears in the file
+    if any(name in data for name in _FIXED_FUNCTION_NAMES):
+        for match in _ADD_PATTERN.finditer(data):
+            edits.append((
+                match.start(),
+                match.end() - match.start(),
+                _add_anim_param(match),
+                match.group('fn').decode('ascii')
+            ))
+    
+    return edits
 
 def fix_eez_lvgl9_compatibility(source, target, env):
     """
@@ -39,75 +156,92 @@ def fix_eez_lvgl9_compatibility(source, target, env):
     
     print(f"🔧 Checking EEZ Studio LVGL 9.3.0 compatibility: {eez_flow_path}")
     
-    # Read the file
-    with open(eez_flow_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    original_content = content
-    fixes_applied = 0
-    
-    # Define function patterns to fix
-    # Each pattern ADDS the missing animation parameter (third parameter)
-    
-    function_fixes = [
-        {
-            'name': 'lv_bar_set_value',
-            # Matches: lv_bar_set_value(obj, value)
-            # Replaces with: lv_bar_set_value(obj, value, LV_ANIM_OFF)
-            'pattern': r'lv_bar_set_value\s*\(\s*([^,]+)\s*,\s*([^)]+)\s*\)',
-            'replacement': r'lv_bar_set_value(\1, \2, LV_ANIM_OFF)'
-        },
-        {
-            'name': 'lv_roller_set_selected',
-            # Matches: lv_roller_set_selected(obj, value)
-            # Replaces with: lv_roller_set_selected(obj, value, LV_ANIM_OFF)
-            'pattern': r'lv_roller_set_selected\s*\(\s*([^,]+)\s*,\s*([^)]+)\s*\)',
-            'replacement': r'lv_roller_set_selected(\1, \2, LV_ANIM_OFF)'
-        },
-        {
-            'name': 'lv_slider_set_value',
-            # Matches: lv_slider_set_value(obj, value)
-            # Replaces with: lv_slider_set_value(obj, value, LV_ANIM_OFF)
-            'pattern': r'lv_slider_set_value\s*\(\s*([^,]+)\s*,\s*([^)]+)\s*\)',
-            'replacement': r'lv_slider_set_value(\1, \2, LV_ANIM_OFF)'
-        },
-        {
-            'name': 'lv_slider_set_start_value',
-            # Matches: lv_slider_set_start_value(obj, value)
-            # Replaces with: lv_slider_set_start_value(obj, value, LV_ANIM_OFF)
-            'pattern': r'lv_slider_set_start_value\s*\(\s*([^,]+)\s*,\s*([^)]+)\s*\)',
-            'replacement': r'lv_slider_set_start_value(\1, \2, LV_ANIM_OFF)'
-        },
-        {
-            'name': 'lv_dropdown_set_selected',
-            # Matches: lv_dropdown_set_selected(obj, value)
-            # Replaces with: lv_dropdown_set_selected(obj, value, LV_ANIM_OFF)
-            'pattern': r'lv_dropdown_set_selected\s*\(\s*([^,]+)\s*,\s*([^)]+)\s*\)',
-            'replacement': r'lv_dropdown_set_selected(\1, \2, LV_ANIM_OFF)'
-        }
-    ]
-    
-    # Apply each fix
-    for fix in function_fixes:
-        # Only match calls that DON'T already have LV_ANIM parameter
-        # This prevents double-fixing
-        pattern_with_check = fix['pattern'].replace(')', r'(?!.*LV_ANIM)')
-        content_before = content
-        content, count = re.subn(fix['pattern'], fix['replacement'], content)
-        
-        if count > 0:
-            print(f"   ✅ Fixed {count} {fix['name']}() call(s)")
-            fixes_applied += count
-    
-    # Write back if changes were made
-    if content != original_content:
-        with open(eez_flow_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+    # Skip entirely if the file is unchanged since it was last fixed
+    cache_path = os.path.join(os.path.dirname(eez_flow_path), ".eez_fix_cache")
+    cached = _load_fix_cache(cache_path)
+    st = os.stat(eez_flow_path)
+    
+    if cached and cached.get('mtime_ns') == st.st_mtime_ns and cached.get('size') == st.st_size:
+        print("✅ EEZ Studio code unchanged since last fix (cached) - skipping")
+        return
+    
+    # Read the file as raw bytes (mmap cannot map an empty file)
+    with open(eez_flow_path, 'rb') as f:
+        if st.st_size > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                data = bytes(mm)
+        else:
+            data = b''
+    
+    # Replay the edits if this exact content was patched before, otherwise
+    # find them with the regex and remember them keyed by the content hash
+    digest = hashlib.sha256(data).hexdigest()
+    memo_path = os.path.join(env.subst("$PROJECT_BUILD_DIR"), ".eez_patch_memo.json")
+    edits = _load_patch_memo(memo_path, digest, len(data))
+    
+    if edits is not None:
+        print("   ♻️  Replaying cached patch for identical content")
+    else:
+        edits = _find_edits(data)
+        _save_patch_memo(memo_path, digest, edits)
+    
+    # Apply all edits, collecting the unchanged slices and replacements so the
+    # output is built with one join
+    fix_counts = Counter()
+    parts = []
+    last = 0
+    
+    for offset, old_len, new_bytes, name in edits:
+        fix_counts[name] += 1
+        parts.append(data[last:offset])
+        parts.append(new_bytes)
+        last = offset + old_len
+    
+    fixes_applied = len(edits)
+    
+    if fixes_applied > 0:
+        parts.append(data[last:])
+        data = b''.join(parts)
+    
+    for name in _FIXED_FUNCTIONS:
+        if fix_counts[name] > 0:
+            print(f"   ✅ Fixed {fix_counts[name]} {name}() call(s)")
+    
+    # Write back only if a substitution was made
+    if fixes_applied > 0:
+        # Write to a temporary file and swap it in, so a half-written file
+        # can never be mistaken for a fixed one
+        temp_path = eez_flow_path + ".tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, eez_flow_path)
         print(f"✅ EEZ Studio LVGL 9.3.0 compatibility fixes applied: {fixes_applied} total changes")
     else:
         print("✅ EEZ Studio code already compatible - no fixes needed")
+    
+    _save_fix_cache(cache_path, eez_flow_path)
+
+def fix_eez_lvgl9_compatibility_action(target, source, env):
+    """SCons action: run the fixer, then touch the stamp file on success"""
+    fix_eez_lvgl9_compatibility(source, target, env)
+    
+    with open(str(target[0]), 'w') as f:
+        f.write("")
 
-# Register the callback to run before building
-env.AddPreAction("$BUILD_DIR/${PROGNAME}.elf", fix_eez_lvgl9_compatibility)
+# Register the fixer as a build step keyed on eez-flow.cpp, so SCons's
+# decider skips it while the source is unchanged, and make the object depend
+# on it so the file is fixed before it is compiled in the same build.
+# The action rewrites its own source when it applies fixes, so SCons sees a
+# changed source and runs it once more on the next build; that run is
+# answered by the .eez_fix_cache sentinel and leaves the file alone.
+if os.path.exists(env.subst(os.path.join("$PROJECT_SRC_DIR", "ui", "eez-flow.cpp"))):
+    stamp = env.Command(
+        "$BUILD_DIR/.eez_fixed.stamp",
+        "$PROJECT_SRC_DIR/ui/eez-flow.cpp",
+        fix_eez_lvgl9_compatibility_action
+    )
+    env.Depends("$BUILD_DIR/src/ui/eez-flow.cpp.o", stamp)
+else:
+    print("⚠️  EEZ flow file not found - compatibility fixer not registered")
 
 print("🔍 EEZ Studio LVGL 9.3.0 compatibility fixer loaded")
\ No newline at end of file
@@ -12,7 +12,9 @@
 # ==============================================================================
 
 Import("env")
+import hashlib
 import subprocess
+import shutil
 import re
 import os
 
@@ -23,16 +25,54 @@ def print_banner(message):
     print(f"  {message}")
     print(f"{banner}\n")
 
+def version_cache_key(env, compiler_path, pioenv):
+    """Build the cache key from the compiler binary and the platform version"""
+    compiler_mtime = 0
+    if compiler_path and os.path.exists(compiler_path):
+        compiler_mtime = os.stat(compiler_path).st_mtime_ns
+    
+    try:
+        platform_version = str(env.PioPlatform().version)
+    except Exception:
+        platform_version = "UNKNOWN"
+    
+    key = f"{compiler_path}|{compiler_mtime}|{platform_version}|{pioenv}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
 def extract_versions(source, target, env):
     """Extract compiler and platform versions and create header file"""
     
     print_banner("Version Extraction Script")
     
     # ========================================================================
-    # EXTRACT XTENSA COMPILER VERSION
+    # SKIP IF COMPILER AND PLATFORM ARE UNCHANGED SINCE THE LAST RUN
     # ========================================================================
+    # Expand each SCons variable once and reuse the results below
     compiler = env.subst("$CC")
+    project_dir = env.subst("$PROJECT_DIR")
+    build_dir = env.subst("$PROJECT_BUILD_DIR")
+    pioenv = env.subst("$PIOENV")
+    unix_time = env.subst("$UNIX_TIME")
     
+    compiler_path = env.WhereIs(compiler) or shutil.which(compiler)
+    header_path = os.path.join(project_dir, "include", "EARS_toolsVersionDef.h")
+    cache_path = os.path.join(build_dir, ".version_cache")
+    cache_key = version_cache_key(env, compiler_path, pioenv)
+    
+    try:
+        with open(cache_path, 'r') as f:
+            cached_key = f.read().strip()
+    except OSError:
+        cached_key = None
+    
+    if cached_key == cache_key and os.path.exists(header_path):
+        print(f"✓ Compiler and platform unchanged - keeping {header_path}")
+        print_banner("Version Extraction Complete")
+        return
+    
+    # ========================================================================
+    # EXTRACT XTENSA COMPILER VERSION
+    # ========================================================================
     xtensa_version = "UNKNOWN"
     xtensa_major = 0
     xtensa_minor = 0
@@ -40,11 +80,10 @@ def extract_versions(source, target, env):
     
     try:
         result = subprocess.run(
-            [compiler, "--version"],
+            [compiler_path or compiler, "--version"],
             capture_output=True,
             text=True,
-            timeout=10,
-            shell=True
+            timeout=10
         )
         
         version_output = result.stdout + result.stderr
@@ -91,43 +130,46 @@ def extract_versions(source, target, env):
     # ========================================================================
     # CREATE HEADER FILE
     # ========================================================================
-    project_dir = env.subst("$PROJECT_DIR")
-    include_dir = os.path.join(project_dir, "include")
+    include_dir = os.path.dirname(header_path)
     
     if not os.path.exists(include_dir):
         os.makedirs(include_dir, exist_ok=True)
     
-    header_path = os.path.join(include_dir, "EARS_toolsVersionDef.h")
+    header = (
+        "// Auto-generated version information\n"
+        "// Do not edit manually\n"
+        f"// Generated on: {pioenv}\n"
+        f"// Build timestamp: {unix_time}\n\n"
+        
+        "#ifndef __EARS_TOOLS_VERSION_H__\n"
+        "#define __EARS_TOOLS_VERSION_H__\n\n"
+        
+        "// Xtensa Compiler Version\n"
+        f"#define EARS_XTENSA_COMPILER_VERSION \"{xtensa_version}\"\n"
+        f"#define EARS_XTENSA_COMPILER_MAJOR {xtensa_major}\n"
+        f"#define EARS_XTENSA_COMPILER_MINOR {xtensa_minor}\n"
+        f"#define EARS_XTENSA_COMPILER_PATCH {xtensa_patch}\n\n"
+        
+        "// Espressif Platform Version (espressif32)\n"
+        f"#define EARS_ESPRESSIF_PLATFORM_VERSION \"{platform_version}\"\n"
+        f"#define EARS_ESPRESSIF_PLATFORM_MAJOR {platform_major}\n"
+        f"#define EARS_ESPRESSIF_PLATFORM_MINOR {platform_minor}\n"
+        f"#define EARS_ESPRESSIF_PLATFORM_PATCH {platform_patch}\n\n"
+        
+        "#endif // __EARS_TOOLS_VERSION_H__\n"
+    )
     
     try:
+        # Single write of the whole header; a failure raises and is reported below
         with open(header_path, 'w') as f:
-            f.write("// Auto-generated version information\n")
-            f.write("// Do not edit manually\n")
-            f.write(f"// Generated on: {env.subst('$PIOENV')}\n")
-            f.write(f"// Build timestamp: {env.subst('$UNIX_TIME')}\n\n")
-            
-            f.write("#ifndef __EARS_TOOLS_VERSION_H__\n")
-            f.write("#define __EARS_TOOLS_VERSION_H__\n\n")
-            
-            f.write("// Xtensa Compiler Version\n")
-            f.write(f"#define EARS_XTENSA_COMPILER_VERSION \"{xtensa_version}\"\n")
-            f.write(f"#define EARS_XTENSA_COMPILER_MAJOR {xtensa_major}\n")
-            f.write(f"#define EARS_XTENSA_COMPILER_MINOR {xtensa_minor}\n")
-            f.write(f"#define EARS_XTENSA_COMPILER_PATCH {xtensa_patch}\n\n")
-            
-            f.write("// Espressif Platform Version (espressif32)\n")
-            f.write(f"#define EARS_ESPRESSIF_PLATFORM_VERSION \"{platform_version}\"\n")
-            f.write(f"#define EARS_ESPRESSIF_PLATFORM_MAJOR {platform_major}\n")
-            f.write(f"#define EARS_ESPRESSIF_PLATFORM_MINOR {platform_minor}\n")
-            f.write(f"#define EARS_ESPRESSIF_PLATFORM_PATCH {platform_patch}\n\n")
-            
-            f.write("#endif // __EARS_TOOLS_VERSION_H__\n")
+            f.write(header)
+        print(f"✓ Header created: {header_path} ({len(header)} bytes)")
         
-        if os.path.exists(header_path):
-            file_size = os.path.getsize(header_path)
-            print(f"✓ Header created: {header_path} ({file_size} bytes)")
-        else:
-            print(f"✗ Error: Header file was not created!")
+        # Only cache a complete result so a failed probe is retried next build
+        if xtensa_version != "UNKNOWN" and platform_version != "UNKNOWN":
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(cache_path, 'w') as f:
+                f.write(cache_key)
             
     except Exception as e:
         print(f"✗ Error writing header file: {e}")
@@ -1,20 +1,121 @@
 Import("env")
 
+import json
+import os
 import re
 from datetime import datetime
 
-def increment_build(header_file):
-    """Increment patch version and update timestamp in EARS_versionDef.h"""
+# Either version define: groups 1-3 wrap the quoted PATCH number, groups 4-5
+# the bare TIMESTAMP digits, so one sub() call can update both
+_VERSION_RE = re.compile(
+    rb'(#define\s+EARS_APP_VERSION_PATCH\s+")(\d+)(")|(#define\s+EARS_APP_BUILD_TIMESTAMP\s+)(\d+)',
+    re.ASCII
+)
+
+# Never let the C runtime translate line endings on Windows
+_O_BINARY = getattr(os, 'O_BINARY', 0)
+
+# Text written immediately before each value by the regex path
+_PATCH_MARKER = b'#define EARS_APP_VERSION_PATCH "'
+_TIMESTAMP_MARKER = b'#define EARS_APP_BUILD_TIMESTAMP '
+
+def _offsets_path(header_file):
+    """Sentinel recording where the PATCH and TIMESTAMP values sit in the header"""
+    return os.path.join(os.path.dirname(header_file), ".version_offsets")
+
+def _record_offsets(header_file, offsets):
+    """Remember the byte offsets of the values just written by the regex path"""
+    try:
+        with open(_offsets_path(header_file), 'w', encoding='utf-8') as f:
+            json.dump(offsets, f)
+    except OSError as e:
+        print(f"✗ WARNING: Could not record version offsets: {e}")
+
+def _increment_in_place(header_file, timestamp):
+    """
+    Patch the PATCH and TIMESTAMP values at their recorded offsets
     
-    print("=" * 70)
-    print("  BUILD VERSION INCREMENT SCRIPT")
-    print("=" * 70)
+    Only the bytes around each value are read. Returns the previous patch
+    number, or None if the sentinel is missing or stale, or the new values
+    no longer fit the recorded widths.
+    """
+    try:
+        with open(_offsets_path(header_file), 'r', encoding='utf-8') as f:
+            offsets = json.load(f)
+        size = offsets['size']
+        patch_offset = offsets['patch_offset']
+        patch_width = offsets['patch_width']
+        ts_offset = offsets['ts_offset']
+        ts_width = offsets['ts_width']
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    
+    new_timestamp = timestamp.encode('ascii')
+    if len(new_timestamp) != ts_width:
+        return None
     
-    # Read the current file
     try:
-        with open(header_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-        print(f"✓ File read: {header_file} ({len(content)} bytes)")
+        with open(header_file, 'r+b') as f:
+            if os.fstat(f.fileno()).st_size != size:
+                return None
+            
+            f.seek(patch_offset - len(_PATCH_MARKER))
+            chunk = f.read(len(_PATCH_MARKER) + patch_width + 1)
+            old_patch = chunk[len(_PATCH_MARKER):-1]
+            if not (chunk.startswith(_PATCH_MARKER) and chunk.endswith(b'"') and old_patch.isdigit()):
+                return None
+            
+            f.seek(ts_offset - len(_TIMESTAMP_MARKER))
+            chunk = f.read(len(_TIMESTAMP_MARKER) + ts_width + 1)
+            old_timestamp = chunk[len(_TIMESTAMP_MARKER):len(_TIMESTAMP_MARKER) + ts_width]
+            if not (chunk.startswith(_TIMESTAMP_MARKER) and old_timestamp.isdigit()
+                    and not chunk[len(_TIMESTAMP_MARKER) + ts_width:].isdigit()):
+                return None
+            
+            current_patch = int(old_patch)
+            new_patch = str(current_patch + 1).encode('ascii')
+            if len(new_patch) != patch_width:
+                return None
+            
+            f.seek(patch_offset)
+            f.write(new_patch)
+            f.seek(ts_offset)
+            f.write(new_timestamp)
+    except OSError:
+        return None
+    
+    return current_patch
+
+def _read_all(fd):
+    """Read the whole file behind fd with raw os.read calls"""
+    remaining = os.fstat(fd).st_size
+    chunks = []
+    
+    while remaining > 0:
+        chunk = os.read(fd, remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    
+    return b''.join(chunks)
+
+def _write_all(fd, content):
+    """Overwrite the file behind fd with content and truncate any leftover tail"""
+    os.lseek(fd, 0, os.SEEK_SET)
+    view = memoryview(content)
+    
+    while view:
+        view = view[os.write(fd, view):]
+    
+    os.ftruncate(fd, len(content))
+
+def _increment_with_regex(header_file, timestamp):
+    """Rewrite the whole header via the version regex and record the new offsets"""
+    
+    # Open once for the whole read-modify-write, bypassing text-mode I/O
+    try:
+        fd = os.open(header_file, os.O_RDWR | _O_BINARY)
     except FileNotFoundError:
         print(f"✗ ERROR: File not found: {header_file}")
         return
@@ -22,36 +123,89 @@ def increment_build(header_file):
         print(f"✗ ERROR: Could not read {header_file}: {e}")
         return
     
-    # Find and increment EARS_APP_VERSION_PATCH
-    patch_pattern = r'#define\s+EARS_APP_VERSION_PATCH\s+"(\d+)"'
-    match = re.search(patch_pattern, content)
+    try:
+        _rewrite_header(fd, header_file, timestamp)
+    finally:
+        os.close(fd)
+
+def _rewrite_header(fd, header_file, timestamp):
+    """Apply the version regex to the header open on fd"""
+    
+    # Read the current file
+    try:
+        content = _read_all(fd)
+        print(f"✓ File read: {header_file} ({len(content)} bytes)")
+    except Exception as e:
+        print(f"✗ ERROR: Could not read {header_file}: {e}")
+        return
+    
+    # Increment EARS_APP_VERSION_PATCH and update EARS_APP_BUILD_TIMESTAMP,
+    # noting where each new value lands in the output for the fast path
+    found = {}
+    offsets = {}
+    delta = 0
+    
+    def update_define(match):
+        nonlocal delta
+        if match.group(2) is not None:
+            found['patch'] = int(match.group(2))
+            new_patch = str(found['patch'] + 1).encode('ascii')
+            replacement = _PATCH_MARKER + new_patch + b'"'
+            offsets.setdefault('patch_offset', match.start() + delta + len(_PATCH_MARKER))
+            offsets.setdefault('patch_width', len(new_patch))
+        elif 'timestamp' in found:
+            return match.group(0)
+        else:
+            found['timestamp'] = True
+            replacement = _TIMESTAMP_MARKER + timestamp.encode('ascii')
+            offsets['ts_offset'] = match.start() + delta + len(_TIMESTAMP_MARKER)
+            offsets['ts_width'] = len(timestamp)
+        delta += len(replacement) - len(match.group(0))
+        return replacement
     
-    if match:
-        current_patch = int(match.group(1))
-        new_patch = current_patch + 1
-        content = re.sub(patch_pattern, f'#define EARS_APP_VERSION_PATCH "{new_patch}"', content)
-        print(f"✓ Patch version: {current_patch} -> {new_patch}")
+    content = _VERSION_RE.sub(update_define, content, count=2)
+    
+    if 'patch' in found:
+        print(f"✓ Patch version: {found['patch']} -> {found['patch'] + 1}")
     else:
         print("✗ ERROR: EARS_APP_VERSION_PATCH not found")
         return
     
-    # Update EARS_APP_BUILD_TIMESTAMP
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    timestamp_pattern = r'#define\s+EARS_APP_BUILD_TIMESTAMP\s+\d+'
-    
-    if re.search(timestamp_pattern, content):
-        content = re.sub(timestamp_pattern, f'#define EARS_APP_BUILD_TIMESTAMP {timestamp}', content, count=1)
+    if 'timestamp' in found:
         print(f"✓ Timestamp: {timestamp}")
     else:
         print("✗ WARNING: EARS_APP_BUILD_TIMESTAMP not found")
     
     # Write back to file
     try:
-        with open(header_file, 'w', encoding='utf-8') as f:
-            f.write(content)
+        _write_all(fd, content)
         print(f"✓ File updated: {header_file}")
     except Exception as e:
         print(f"✗ ERROR: Could not write to {header_file}: {e}")
+        return
+    
+    if 'timestamp' in found:
+        offsets['size'] = len(content)
+        _record_offsets(header_file, offsets)
+
+def increment_build(header_file):
+    """Increment patch version and update timestamp in EARS_versionDef.h"""
+    
+    print("=" * 70)
+    print("  BUILD VERSION INCREMENT SCRIPT")
+    print("=" * 70)
+    
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    
+    # Fast path: same layout as the last build, so patch the values in place
+    current_patch = _increment_in_place(header_file, timestamp)
+    
+    if current_patch is not None:
+        print(f"✓ Patch version: {current_patch} -> {current_patch + 1}")
+        print(f"✓ Timestamp: {timestamp}")
+        print(f"✓ File updated in place: {header_file}")
+    else:
+        _increment_with_regex(header_file, timestamp)
     
     print("=" * 70)
     print("")
@@ -3,12 +3,14 @@
 
 Import("env") # type: ignore
 import os
+import re
+
+# Helium/NEON sources and any assembly file, checked with one search per node
+_ARM_FILES_RE = re.compile(r'helium|neon|\.S$')
 
 def exclude_arm_files(node):
     """Exclude ARM Helium and NEON assembly files"""
-    return None if ("helium" in node.get_path() or 
-                    "neon" in node.get_path() or
-                    node.get_path().endswith(".S")) else node
+    return None if _ARM_FILES_RE.search(node.get_path()) else node
 
 # Apply filter to source files
 env.AddBuildMiddleware(exclude_arm_files, "*")
@@ -4,113 +4,352 @@ Checks all .cpp and .h files for proper application-specific Doxygen annotations
 Run this before compilation to catch documentation issues early
 """
 
+import json
 import os
 import re
 import sys
-from pathlib import Path
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache, partial
+from itertools import islice
+
+# Doxygen comment block (/** or /*!) up to its */, or to end of file if the
+# block is never closed. The lookahead keeps an empty /**/ from running on
+# into the next comment. The literal /* prefix lets the regex engine jump
+# straight between comment openers, so no per-line marker checks are needed.
+# A bytes pattern, so files are scanned as read, without decoding them first.
+_DOXY_BLOCK_RE = re.compile(rb'/\*(?=[*!])(.*?)(?:\*/|\Z)', re.DOTALL)
+
+# Below this many files, starting worker processes costs more than it saves
+_PARALLEL_MIN_FILES = 256
+
+# Files handed to a worker per batch, to amortise inter-process overhead
+_PARALLEL_CHUNKSIZE = 32
+
+# Serial fallback: reader threads, and how many files they may read ahead
+_PREFETCH_WORKERS = 8
+_PREFETCH_DEPTH = 64
+
+# Per-file results from the last run, kept in the project root
+_CACHE_NAME = '.validate_doxygen.cache.json'
+
+# Bump whenever block scanning or command classification changes, so results
+# produced by older logic are not served again
+_CACHE_VERSION = 1
+
+# Directories never descended into
+_SKIP_DIRS = frozenset({'.git', '.pio', 'build', 'test'})
+
+def _iter_sources(path, extensions, skip=_SKIP_DIRS):
+    """
+    Yield source file paths under path, files before subdirectories
+    
+    Uses os.scandir so the file/directory type comes from the directory
+    listing itself, with no extra stat call per entry. Unreadable
+    directories are skipped silently, as os.walk does.
+    """
+    subdirs = []
+    
+    try:
+        entries = os.scandir(path)
+    except OSError:
+        return
+    
+    with entries:
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                is_dir = False
+            
+            if is_dir:
+                if entry.name not in skip:
+                    subdirs.append(entry.path)
+            elif entry.name.endswith(extensions):
+                yield entry.path
+    
+    for subdir in subdirs:
+        yield from _iter_sources(subdir, extensions, skip)
+
+@lru_cache(maxsize=None)
+def _issue_regex(allowed, forbidden):
+    """
+    Compile one regex matching only the commands that need reporting
+    
+    Forbidden commands land in the 'forbidden' group and anything not
+    allowed in the 'unknown' group, so blocks using only allowed commands
+    produce no match at all. An empty set contributes no branch, since an
+    empty alternation would match a bare '@'. Cached per command set, so
+    each process compiles it once.
+    """
+    def names(commands):
+        words = sorted((cmd[1:] for cmd in commands), key=len, reverse=True)
+        return b'|'.join(re.escape(word).encode('ascii') for word in words)
+    
+    branches = []
+    if forbidden:
+        branches.append(rb'(?P<forbidden>' + names(forbidden) + rb')(?!\w)')
+    
+    unknown = rb'(?P<unknown>\w+)'
+    if allowed:
+        unknown = rb'(?!(?:' + names(allowed) + rb')(?!\w))' + unknown
+    branches.append(unknown)
+    
+    return re.compile(rb'@(?:' + b'|'.join(branches) + rb')', re.ASCII)
+
+def _load_cache(cache_path, commands):
+    """
+    Load cached per-file results: path -> [mtime_ns, size, errors, warnings]
+    
+    Returns an empty cache if the file is missing, unreadable, or was written
+    by another cache version or with different command sets.
+    """
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        if (cache.get('version') == _CACHE_VERSION and cache.get('commands') == commands
+                and isinstance(cache.get('files'), dict)):
+            return cache['files']
+    except (OSError, ValueError, AttributeError):
+        pass
+    return {}
+
+def _save_cache(cache_path, commands, files):
+    """Write the results cache atomically; a failed write only costs a rescan"""
+    tmp_path = cache_path + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': _CACHE_VERSION, 'commands': commands, 'files': files}, f)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"⚠ Could not write validation cache {cache_path}: {e}")
+
+def _read_source(filepath):
+    """Read a source file as raw bytes"""
+    # Unbuffered binary read skips the text-mode reader stack
+    with open(filepath, 'rb', buffering=0) as f:
+        return f.read()
+
+def _validate_one(filepath, allowed, forbidden):
+    """
+    Validate a single file for proper Doxygen usage
+    
+    Module-level and returning (errors, warnings) rather than touching a
+    validator, so it can run in a worker process.
+    """
+    try:
+        data = _read_source(filepath)
+    except Exception as e:
+        return [f"Error reading {filepath}: {str(e)}"], []
+    
+    return _validate_source(filepath, data, allowed, forbidden)
+
+def _validate_source(filepath, data, allowed, forbidden):
+    """Validate the already-read bytes of one file; returns (errors, warnings)"""
+    errors = []
+    warnings = []
+    
+    try:
+        # Invalid UTF-8 still raises and is reported below; pure ASCII
+        # files, the usual case, skip the decode altogether
+        if not data.isascii():
+            data.decode('utf-8')
+        
+        # Files without any Doxygen block need no further scanning
+        if b'/**' not in data and b'/*!' not in data:
+            return errors, warnings
+        
+        issue_re = _issue_regex(allowed, forbidden)
+        
+        # Find all Doxygen comment blocks, then any command inside them that
+        # is not allowed. Each such command is reported once per block, at
+        # its first occurrence; line numbers are only worked out then.
+        for block in _DOXY_BLOCK_RE.finditer(data):
+            body = block.group(1)
+            
+            # Most blocks carry no command, so skip the regex for them
+            if b'@' not in body:
+                continue
+            
+            reported = set()
+            
+            for match in issue_re.finditer(body):
+                cmd = match.group().decode('ascii')
+                if cmd in reported:
+                    continue
+                reported.add(cmd)
+                
+                line_num = data.count(b'\n', 0, block.start(1) + match.start()) + 1
+                
+                # The matching group says which kind of issue it is
+                if match.lastgroup == 'forbidden':
+                    errors.append(
+                        f"{filepath}:{line_num} - Forbidden Doxygen command: {cmd}"
+                    )
+                
+                # Otherwise the command is unknown
+                else:
+                    warnings.append(
+                        f"{filepath}:{line_num} - Unknown Doxygen command: {cmd}"
+                    )
+            
+    except Exception as e:
+        errors.append(f"Error reading {filepath}: {str(e)}")
+    
+    return errors, warnings
 
 class DoxygenValidator:
     """Validates Doxygen annotations in source files"""
     
+    __slots__ = ('project_root', 'errors', 'warnings', 'cache_path', 'cache', 'fresh_cache')
+    
+    # Define allowed Doxygen commands for your application
+    ALLOWED_COMMANDS = frozenset({
+        '@file', '@brief', '@author', '@date', '@version',
+        '@param', '@return', '@returns', '@note', '@warning',
+        '@see', '@class', '@struct', '@enum', '@var',
+        '@code', '@endcode', '@example', '@details',
+        '@pre', '@post', '@todo', '@bug', '@deprecated'
+    })
+    
+    # Commands that should NOT be used
+    FORBIDDEN_COMMANDS = frozenset({
+        '@internal', '@mainpage', '@page', '@section',
+        '@subsection', '@private'  # Add any others you want to forbid
+    })
+    
     def __init__(self, project_root):
-        self.project_root = Path(project_root)
+        self.project_root = os.fspath(project_root)
         self.errors = []
         self.warnings = []
-        
-        # Define allowed Doxygen commands for your application
-        self.allowed_commands = {
-            '@file', '@brief', '@author', '@date', '@version',
-            '@param', '@return', '@returns', '@note', '@warning',
-            '@see', '@class', '@struct', '@enum', '@var',
-            '@code', '@endcode', '@example', '@details',
-            '@pre', '@post', '@todo', '@bug', '@deprecated'
-        }
-        
-        # Commands that should NOT be used
-        self.forbidden_commands = {
-            '@internal', '@mainpage', '@page', '@section',
-            '@subsection', '@private'  # Add any others you want to forbid
-        }
+        self.cache_path = os.path.join(project_root, _CACHE_NAME)
+        self.cache = _load_cache(self.cache_path, self._cache_commands())
+        self.fresh_cache = {}
+    
+    def _cache_commands(self):
+        """Command sets the cached results were produced with"""
+        return [sorted(self.ALLOWED_COMMANDS), sorted(self.FORBIDDEN_COMMANDS)]
     
     def validate_file(self, filepath):
         """Validate a single file for proper Doxygen usage"""
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
-                lines = content.split('\n')
-                
-            # Find all Doxygen comments
-            in_comment = False
-            comment_start_line = 0
-            
-            for line_num, line in enumerate(lines, 1):
-                # Check for Doxygen comment blocks
-                if '/**' in line or '/*!' in line:
-                    in_comment = True
-                    comment_start_line = line_num
-                
-                if in_comment:
-                    # Find all @ commands
-                    commands = re.findall(r'@\w+', line)
-                    
-                    for cmd in commands:
-                        # Check for forbidden commands
-                        if cmd in self.forbidden_commands:
-                            self.errors.append(
-                                f"{filepath}:{line_num} - Forbidden Doxygen command: {cmd}"
-                            )
-                        
-                        # Check for unknown commands
-                        elif cmd not in self.allowed_commands:
-                            self.warnings.append(
-                                f"{filepath}:{line_num} - Unknown Doxygen command: {cmd}"
-                            )
-                
-                if '*/' in line:
-                    in_comment = False
-                    
-        except Exception as e:
-            self.errors.append(f"Error reading {filepath}: {str(e)}")
+        errors, warnings = _validate_one(filepath, self.ALLOWED_COMMANDS, self.FORBIDDEN_COMMANDS)
+        self.errors.extend(errors)
+        self.warnings.extend(warnings)
     
     def scan_directory(self, directory, extensions=('.cpp', '.h')):
         """Scan directory recursively for source files"""
-        file_count = 0
+        filepaths = list(_iter_sources(directory, extensions))
+        results = [None] * len(filepaths)
+        stale = []
+        
+        # Reuse the last result for files whose mtime and size are unchanged
+        cache = self.cache
+        fresh_cache = self.fresh_cache
+        for index, filepath in enumerate(filepaths):
+            try:
+                st = os.stat(filepath)
+                key = [st.st_mtime_ns, st.st_size]
+            except OSError:
+                key = None
+            
+            cached = cache.get(filepath)
+            if key is not None and cached is not None and cached[:2] == key:
+                results[index] = (cached[2], cached[3])
+                fresh_cache[filepath] = cached
+            else:
+                stale.append((index, filepath, key))
         
-        for root, dirs, files in os.walk(directory):
-            # Skip certain directories
-            dirs[:] = [d for d in dirs if d not in ['.git', '.pio', 'build', 'test']]
+        validated = self._validate_all([filepath for _, filepath, _ in stale])
+        for (index, filepath, key), (errors, warnings) in zip(stale, validated):
+            results[index] = (errors, warnings)
             
-            for file in files:
-                if file.endswith(extensions):
-                    filepath = Path(root) / file
-                    self.validate_file(filepath)
-                    file_count += 1
+            # Read failures may clear without the file changing, so retry them
+            if key is not None and not any(e.startswith("Error reading ") for e in errors):
+                fresh_cache[filepath] = key + [errors, warnings]
         
-        return file_count
+        errors_extend = self.errors.extend
+        warnings_extend = self.warnings.extend
+        for errors, warnings in results:
+            errors_extend(errors)
+            warnings_extend(warnings)
+        
+        return len(filepaths)
+    
+    def save_cache(self):
+        """Persist the results of this run for the next one"""
+        if self.fresh_cache != self.cache:
+            _save_cache(self.cache_path, self._cache_commands(), self.fresh_cache)
+    
+    def _validate_all(self, filepaths):
+        """Yield (errors, warnings) for each file, in order"""
+        # Files are independent, so validate them across all cores when there
+        # are enough to pay for the worker processes; map() keeps file order
+        if len(filepaths) >= _PARALLEL_MIN_FILES and (os.cpu_count() or 1) > 1:
+            worker = partial(
+                _validate_one,
+                allowed=self.ALLOWED_COMMANDS,
+                forbidden=self.FORBIDDEN_COMMANDS
+            )
+            with ProcessPoolExecutor() as executor:
+                yield from executor.map(worker, filepaths, chunksize=_PARALLEL_CHUNKSIZE)
+        else:
+            yield from self._validate_prefetched(filepaths)
+    
+    def _validate_prefetched(self, filepaths):
+        """
+        Validate files in order on this thread while reader threads fetch
+        up to _PREFETCH_DEPTH files ahead, hiding open/read latency
+        """
+        remaining = iter(filepaths)
+        
+        # Bind everything the loop touches to locals once
+        allowed = self.ALLOWED_COMMANDS
+        forbidden = self.FORBIDDEN_COMMANDS
+        
+        with ThreadPoolExecutor(max_workers=_PREFETCH_WORKERS) as readers:
+            pending = deque(
+                (filepath, readers.submit(_read_source, filepath))
+                for filepath in islice(remaining, _PREFETCH_DEPTH)
+            )
+            
+            while pending:
+                filepath, future = pending.popleft()
+                
+                next_path = next(remaining, None)
+                if next_path is not None:
+                    pending.append((next_path, readers.submit(_read_source, next_path)))
+                
+                try:
+                    data = future.result()
+                except Exception as e:
+                    yield [f"Error reading {filepath}: {str(e)}"], []
+                    continue
+                
+                yield _validate_source(filepath, data, allowed, forbidden)
     
     def report(self):
         """Generate validation report"""
-        print("\n" + "="*70)
-        print("DOXYGEN ANNOTATION VALIDATION REPORT")
-        print("="*70)
+        # Collect the whole report and write it in one go rather than
+        # taking the stdout lock once per line
+        out = ["\n" + "="*70, "DOXYGEN ANNOTATION VALIDATION REPORT", "="*70]
         
         if not self.errors and not self.warnings:
-            print("\n✓ All files passed validation!")
+            out.append("\n✓ All files passed validation!")
+            sys.stdout.write("\n".join(out) + "\n")
             return 0
         
         if self.errors:
-            print(f"\n❌ ERRORS ({len(self.errors)}):")
-            print("-"*70)
-            for error in self.errors:
-                print(f"  {error}")
+            out.append(f"\n❌ ERRORS ({len(self.errors)}):")
+            out.append("-"*70)
+            out.extend(f"  {error}" for error in self.errors)
         
         if self.warnings:
-            print(f"\n⚠ WARNINGS ({len(self.warnings)}):")
-            print("-"*70)
-            for warning in self.warnings:
-                print(f"  {warning}")
+            out.append(f"\n⚠ WARNINGS ({len(self.warnings)}):")
+            out.append("-"*70)
+            out.extend(f"  {warning}" for warning in self.warnings)
         
-        print("\n" + "="*70)
+        out.append("\n" + "="*70)
+        sys.stdout.write("\n".join(out) + "\n")
         
         return len(self.errors)  # Return error count for exit code
 
@@ -128,26 +367,28 @@ def main():
     validator = DoxygenValidator(project_root)
     
     # Scan source directories
-    src_dir = Path(project_root) / 'src'
-    lib_dir = Path(project_root) / 'lib'
-    include_dir = Path(project_root) / 'include'
+    src_dir = os.path.join(project_root, 'src')
+    lib_dir = os.path.join(project_root, 'lib')
+    include_dir = os.path.join(project_root, 'include')
     
     file_count = 0
     
-    if src_dir.exists():
+    if os.path.isdir(src_dir):
         print(f"Scanning src/...")
         file_count += validator.scan_directory(src_dir)
     
-    if lib_dir.exists():
+    if os.path.isdir(lib_dir):
         print(f"Scanning lib/...")
         file_count += validator.scan_directory(lib_dir)
     
-    if include_dir.exists():
+    if os.path.isdir(include_dir):
         print(f"Scanning include/...")
         file_count += validator.scan_directory(include_dir)
     
     print(f"\nScanned {file_count} files")
     
+    validator.save_cache()
+    
     # Generate report and exit with appropriate code
     error_count = validator.report()
     sys.exit(error_count)